@@ -1,69 +1,638 @@
 import os
+import sys
 import glob
 import re
 import ast
 import argparse
-from typing import List, Dict, Any, Optional
+import array
+import bisect
+import collections
+import functools
+import hashlib
+import itertools
+import mmap
+import pickle
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Pattern, Tuple, Union
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants  # Python 3.11+
+except ImportError:
+    import sre_parse, sre_constants
+
+try:
+    import re2  # google-re2: opt-in linear-time matching for user-supplied search patterns
+    _RE2_OPTIONS = re2.Options()
+    _RE2_OPTIONS.log_errors = False  # Rejected patterns fall back to re without stderr noise
+except (ImportError, AttributeError):
+    re2 = None  # Missing, or another module named re2 (e.g. pyre2) without google-re2's Options
+    
+try:
+    import xxhash  # SIMD content hashing for result-cache keys
+except ImportError:
+    xxhash = None
+
+# File I/O releases the GIL, so oversubscribe the CPUs for disk-bound work
+_IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Per-file tasks kept in flight ahead of the consumer: enough to keep every
+# worker busy with the next read while earlier results are processed
+_READAHEAD = 2 * _IO_WORKERS
+
+# Files at least this large are memory-mapped for searching rather than read and cached
+_MMAP_THRESHOLD = 1 << 20
+
+# Total size of the files whose raw bytes an MCP keeps between commands, so a
+# --search followed by --bugs reads each file once when the project fits;
+# MCP(state_budget=...) changes it
+_STATE_BUDGET = 64 << 20
+
+# Of those, total size of the files that also keep their decoded text and line
+# index, which together take about twice the file size again
+_DERIVED_BUDGET = 4 << 20
+
+# Bump whenever cached analysis or bug results change shape or meaning
+_CACHE_VERSION = 3
+
+# Results depend on the interpreter's grammar (a file using `match` is a syntax
+# error before 3.10), so each Python version keeps its own database. Rows are
+# pickled with a fixed protocol that every supported version can read.
+_CACHE_FILE = 'cache-py{}{}.sqlite'.format(*sys.version_info[:2])
+_PICKLE_PROTOCOL = 4
+
+# Lexical bug patterns; structural ones are found on the AST by _find_structural_bugs.
+# Each pattern consumes only its leading token and checks the rest with a
+# lookahead, so that in the combined alternation below one finding never
+# swallows another that starts inside it (e.g. a .get() inside print()).
+_BUG_PATTERNS = [
+    (r'\.get\((?=[^,]+\))', 'dict.get() without default', 'Provide default value to avoid potential None'),
+    (r'print\((?=.*\))', 'Debug print statement', 'Remove debug prints')
+]
+
+def _hoist_lead(pattern: str, group: str) -> str:
+    """Wrap a pattern in a named group, keeping its leading literal outside"""
+    # When every branch of an alternation starts with a literal, re skips
+    # straight to candidate characters instead of trying each branch at
+    # every offset; a group-first branch would disable that. Patterns that
+    # do not start with a plain literal (a class, a group, a repeated
+    # character...) are wrapped whole.
+    parsed = sre_parse.parse(pattern)
+    if pattern[0] != '(' and len(parsed) > 1 and parsed[0][0] is sre_constants.LITERAL:
+        for lead in range(1, len(pattern)):
+            try:
+                if list(sre_parse.parse(pattern[:lead])) == [parsed[0]]:
+                    return f'{pattern[:lead]}(?P<{group}>{pattern[lead:]})'
+            except re.error:
+                continue  # Still inside an escape such as \x41
+    return f'(?P<{group}>{pattern})'
+
+# All bug patterns in one alternation so each file is scanned once. Each
+# pattern's named group ends its branch, so it is always the last group to
+# close and m.lastindex is its number, whatever groups the pattern has inside;
+# _BUG_GROUP_IDS maps that number back to the index into _BUG_META
+_BUG_RE = re.compile('|'.join(_hoist_lead(p, f'g{i}') for i, (p, _, _) in enumerate(_BUG_PATTERNS)))
+_BUG_GROUP_IDS = [None] * (_BUG_RE.groups + 1)
+for _i in range(len(_BUG_PATTERNS)):
+    _BUG_GROUP_IDS[_BUG_RE.groupindex[f'g{_i}']] = _i
+_BUG_META = [(bug_type, suggestion) for _, bug_type, suggestion in _BUG_PATTERNS]
+
+def _prefetch_map(pool: ThreadPoolExecutor, fn: Callable, items: Iterable) -> Iterator:
+    """Like pool.map, in order, but with only a sliding window of _READAHEAD tasks submitted"""
+    pending = collections.deque()
+    for item in items:
+        if len(pending) >= _READAHEAD:
+            yield pending.popleft().result()
+        pending.append(pool.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+def _compile_search(pattern: str, use_re2: bool = False) -> Any:
+    """Compile a search pattern with re, or with re2 when requested and installed"""
+    # Opt-in because patterns RE2 accepts can still match differently: its
+    # \w, \d and \b are ASCII-only and $ does not match before a final newline
+    if use_re2 and re2 is not None:
+        try:
+            return re2.compile(pattern, _RE2_OPTIONS)
+        except re2.error:
+            pass  # Backreferences and lookarounds are only supported by re
+    return re.compile(pattern)
+
+def _required_literal(pattern: str) -> str:
+    """Longest literal run every match of a pattern must contain, or '' if there is none"""
+    try:
+        parsed = sre_parse.parse(pattern)
+        flags = parsed.state.flags if hasattr(parsed, 'state') else parsed.pattern.flags
+    except Exception:
+        return ''
+    if flags & re.IGNORECASE:
+        return ''
+        
+    # Only a top-level sequence of literals is guaranteed to appear verbatim.
+    # Newlines end a run since raw bytes may still hold \r\n line endings.
+    best = run = ''
+    for op, av in parsed:
+        if op is sre_constants.LITERAL and chr(av) not in '\r\n':
+            run += chr(av)
+        else:
+            best = max(best, run, key=len)
+            run = ''
+    return max(best, run, key=len)
+
+def _scan_for_bugs(content: str) -> List[Tuple[int, int]]:
+    """Return a (pattern index, offset) pair for every bug-pattern hit in content"""
+    # The hot loop stays a single comprehension over the C-level scanner; no
+    # per-hit dicts or line lookups are built until the caller knows there are hits
+    return [(_BUG_GROUP_IDS[m.lastindex], m.start(m.lastindex)) for m in _BUG_RE.finditer(content)]
+
+def _line_starts(content: str) -> List[int]:
+    """Offsets at which each line of content starts, for bisecting match positions"""
+    # split() and accumulate() keep the per-character work in C; the final
+    # running total points one past the end of the content and is dropped
+    starts = [0, *itertools.accumulate(len(line) + 1 for line in content.split('\n'))]
+    starts.pop()
+    return starts
+
+def _content_digest(data: bytes) -> str:
+    """64-bit hex digest of file content: xxh3 when installed, blake2b otherwise"""
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def _decode_source(data: Union[bytes, mmap.mmap]) -> str:
+    """Decode UTF-8 file content with universal newlines, as text-mode open() would"""
+    return str(data, 'utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+class FileState:
+    """A file's bytes and the text, line index and AST derived from them, each computed on first use"""
+    
+    __slots__ = ('data', 'mtime_ns', 'size', '_text', '_line_starts')
+    
+    def __init__(self, data: Union[bytes, mmap.mmap], mtime_ns: int, size: int):
+        self.data = data
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self._text = None
+        self._line_starts = None
+        
+    @property
+    def text(self) -> str:
+        """The decoded content; raises UnicodeDecodeError for non-UTF-8 files"""
+        # Read through a local, as drop_derived() may run in another thread
+        text = self._text
+        if text is None:
+            text = self._text = _decode_source(self.data)
+        return text
+        
+    @property
+    def line_starts(self) -> List[int]:
+        """Offsets at which each line of the text starts"""
+        line_starts = self._line_starts
+        if line_starts is None:
+            line_starts = self._line_starts = _line_starts(self.text)
+        return line_starts
+        
+    def drop_derived(self) -> None:
+        """Free the decoded text and line index; both are rebuilt from data on next use"""
+        self._text = None
+        self._line_starts = None
+        
+    @property
+    def tree(self) -> ast.Module:
+        """The parsed module; raises SyntaxError for invalid source"""
+        return _parse_state(self)
+
+# AST nodes are tracked by the cyclic GC, so every retained tree makes full
+# collections slower; rather than living on each FileState, trees are kept
+# only for the few most recently parsed files
+@functools.lru_cache(maxsize=8)
+def _parse_state(state: FileState) -> ast.Module:
+    """Parse a file's text, reusing the tree while its FileState is current"""
+    return ast.parse(state.text)
+
+class _TopLevelVisitor(ast.NodeVisitor):
+    """Collect module-level imports, classes, functions and variables without walking function bodies"""
+    
+    def __init__(self, analysis: Dict[str, Any]):
+        self.analysis = analysis
+        
+    def visit_Module(self, node: ast.Module) -> None:
+        for child in node.body:
+            self.visit(child)
+            
+    def visit_Import(self, node: ast.Import) -> None:
+        for name in node.names:
+            self.analysis['imports'].append(name.name)
+            
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        module = node.module if node.module else ''
+        for name in node.names:
+            self.analysis['imports'].append(f"{module}.{name.name}")
+            
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        class_info = {
+            'name': node.name,
+            'methods': [],
+            'line': node.lineno
+        }
+        
+        for item in node.body:
+            if isinstance(item, ast.FunctionDef):
+                class_info['methods'].append({
+                    'name': item.name,
+                    'line': item.lineno,
+                    'args': [arg.arg for arg in item.args.args]
+                })
+                
+        self.analysis['classes'].append(class_info)
+        
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.analysis['functions'].append({
+            'name': node.name,
+            'line': node.lineno,
+            'args': [arg.arg for arg in node.args.args]
+        })
+        
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        # Not reported, but its body must not be mistaken for module scope
+        pass
+        
+    def visit_Assign(self, node: ast.Assign) -> None:
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.analysis['variables'].append({
+                    'name': target.id,
+                    'line': node.lineno
+                })
+                
+    def generic_visit(self, node: ast.AST) -> None:
+        # Compound statements keep module scope, expressions hold nothing of interest
+        for field in ('body', 'orelse', 'handlers', 'finalbody', 'cases'):
+            for child in getattr(node, field, ()):
+                self.visit(child)
+                
+# Before Python 3.8, True and False parse to NameConstant rather than Constant
+_CONSTANT_NODES = (ast.Constant,) if sys.version_info >= (3, 8) else (ast.Constant, ast.NameConstant)
+
+def _find_structural_bugs(tree: ast.AST) -> List[Tuple[int, str, str]]:
+    """Return (line, bug type, suggestion) for anti-patterns visible in the syntax tree"""
+    # An explicit stack over _fields visits the same nodes as ast.NodeVisitor
+    # at about a third of the cost of its per-node method dispatch
+    hits = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.ExceptHandler):
+            if node.type is None:
+                hits.append((node.lineno, 'Bare except clause', 'Use specific exceptions'))
+            elif isinstance(node.type, ast.Name) and node.type.id == 'Exception':
+                hits.append((node.lineno, 'Too broad exception handling', 'Use more specific exceptions'))
+        elif isinstance(node, ast.Compare):
+            for op, comparator in zip(node.ops, node.comparators):
+                if isinstance(op, ast.Eq) and isinstance(comparator, _CONSTANT_NODES):
+                    if comparator.value is True:
+                        hits.append((node.lineno, 'Unnecessary comparison to True', 'Use "if condition:" instead'))
+                    elif comparator.value is False:
+                        hits.append((node.lineno, 'Unnecessary comparison to False', 'Use "if not condition:" instead'))
+                        
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                previous = None
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        if isinstance(item, ast.For) and _is_list_building(previous, item):
+                            hits.append((previous.lineno, 'Inefficient list building', 'Use list comprehension'))
+                        stack.append(item)
+                        previous = item
+            elif isinstance(value, ast.AST) and not isinstance(value, ast.expr_context):
+                stack.append(value)
+    return hits
+
+def _is_list_building(previous: Optional[ast.AST], loop: ast.For) -> bool:
+    """Whether `x = []` is directly followed by a loop whose body calls x.append()"""
+    if not (isinstance(previous, ast.Assign) and len(previous.targets) == 1 and
+            isinstance(previous.targets[0], ast.Name) and
+            isinstance(previous.value, ast.List) and not previous.value.elts):
+        return False
+    name = previous.targets[0].id
+    for stmt in loop.body:
+        if (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) and
+                isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == 'append' and
+                isinstance(stmt.value.func.value, ast.Name) and stmt.value.func.value.id == name):
+            return True
+    return False
 
 class MCP:
     """Master Control Program for code analysis and management"""
     
-    def __init__(self, project_path: str):
-        """Initialize the MCP with a project path"""
+    def __init__(self, project_path: str, use_cache: bool = False, state_budget: int = _STATE_BUDGET):
+        """Initialize the MCP with a project path, optionally with a persistent result cache"""
         self.project_path = os.path.abspath(project_path)
-        self.files = {}
-        self.structure = {}
+        self._reset_index()
+        self._state = collections.OrderedDict()
+        self._state_bytes = 0
+        self._state_budget = state_budget
+        self._derived = collections.OrderedDict()
+        self._derived_bytes = 0
+        self._state_lock = threading.Lock()
+        self._cache = self._open_cache() if use_cache else None
         print(f"MCP initialized for project: {self.project_path}")
         
+    def _reset_index(self) -> None:
+        """Clear the scanned file and directory tables"""
+        # Stored column-wise: file i is paths[i], rel_paths[i], sizes[i] and of
+        # type types_table[type_ids[i]]; directory d is dir_names[d] under
+        # dir_parents[d], with the indices of its subdirectories and files in
+        # dir_children[d] and dir_files[d]. Directory 0 is the project root.
+        self.paths = []
+        self.rel_paths = []
+        self.type_ids = array.array('H')
+        self.types_table = []
+        self._type_index = {}
+        self.sizes = array.array('q')
+        self.path_to_idx = {}
+        self.dir_names = []
+        self.dir_parents = []
+        self.dir_children = []
+        self.dir_files = []
+        
+    def _open_cache(self) -> Optional[sqlite3.Connection]:
+        """Open the per-project result cache under ~/.cache/mcp, or None if unavailable"""
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        project_hash = hashlib.sha1(self.project_path.encode('utf-8')).hexdigest()[:16]
+        cache_dir = os.path.join(cache_home, 'mcp', project_hash)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(cache_dir, _CACHE_FILE), check_same_thread=False)
+            with conn:
+                if conn.execute('PRAGMA user_version').fetchone()[0] != _CACHE_VERSION:
+                    conn.execute('DROP TABLE IF EXISTS results')
+                    conn.execute(f'PRAGMA user_version = {_CACHE_VERSION}')
+                conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                             'kind TEXT, path TEXT, size INTEGER, digest TEXT, data BLOB, '
+                             'PRIMARY KEY (kind, path))')
+            return conn
+        except (OSError, sqlite3.Error) as e:
+            print(f"Result cache disabled: {e}")
+            return None
+            
+    def _cache_rows(self, kind: str, path: Optional[str] = None) -> Dict[str, Tuple[int, str, bytes]]:
+        """Cached results of one kind (optionally for one path) as path -> (size, digest, pickled result)"""
+        if self._cache is None:
+            return {}
+        query = 'SELECT path, size, digest, data FROM results WHERE kind = ?'
+        params = (kind,)
+        if path is not None:
+            query += ' AND path = ?'
+            params += (path,)
+        try:
+            return {row[0]: row[1:] for row in self._cache.execute(query, params)}
+        except sqlite3.Error:
+            return {}
+            
+    def _cached_result(self, path: str, compute: Callable[[str], Any],
+                       rows: Dict[str, Tuple[int, str, bytes]]) -> Tuple[Any, Optional[Tuple[int, str]]]:
+        """Return compute(path), or the cached result while the file's size and digest still match.
+
+        The second item is the (size, digest) key to store a freshly computed
+        result under, or None when the result came from the cache or the
+        file could not be read.
+        """
+        if self._cache is None:
+            return compute(path), None
+        # Content digests stay correct when checkouts or copies leave mtimes unreliable
+        try:
+            data = self._get_state(path).data
+        except OSError:
+            return compute(path), None
+        key = (len(data), _content_digest(data))
+        
+        row = rows.get(path)
+        if row is not None and row[:2] == key:
+            try:
+                return pickle.loads(row[2]), None
+            except Exception:
+                pass  # A truncated or unreadable blob is a miss; the fresh result replaces it
+        return compute(path), key
+        
+    def _cache_store(self, kind: str, results: Dict[str, Tuple[Tuple[int, str], Any]]) -> None:
+        """Persist freshly computed results, given as path -> ((size, digest), result)"""
+        if self._cache is None or not results:
+            return
+        rows = [(kind, path, *key, pickle.dumps(result, protocol=_PICKLE_PROTOCOL))
+                for path, (key, result) in results.items()]
+        try:
+            with self._cache:
+                self._cache.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', rows)
+        except sqlite3.Error:
+            pass  # Another process holding the database only costs us a cache write
+            
     def scan_project(self, file_types: Optional[List[str]] = None) -> None:
         """Scan the project directory and map its structure"""
         if file_types is None:
             file_types = ['*.py', '*.js', '*.html', '*.css', '*.json']
             
-        self.files = {}
-        self.structure = {'dirs': {}, 'files': []}
-        
-        for root, dirs, files in os.walk(self.project_path):
-            rel_path = os.path.relpath(root, self.project_path)
-            if rel_path == '.':
-                current_level = self.structure
+        # Plain single-extension '*.ext' patterns are matched by suffix; any
+        # others (including '*.min.js'-style ones, since only the last
+        # extension is compared) are translated once and OR-ed into a single
+        # regex, so each name needs one match call
+        suffixes = set()
+        translated = []
+        for pattern in file_types:
+            if pattern.startswith('*.') and '.' not in pattern[2:] and not glob.has_magic(pattern[1:]):
+                suffixes.add(os.path.normcase(pattern[1:]))
             else:
-                # Navigate to correct nested dictionary
-                current_level = self.structure
-                for part in rel_path.split(os.sep):
-                    if part not in current_level['dirs']:
-                        current_level['dirs'][part] = {'dirs': {}, 'files': []}
-                    current_level = current_level['dirs'][part]
+                translated.append(glob.fnmatch.translate(os.path.normcase(pattern)))
+        other_re = re.compile('|'.join(translated)) if translated else None
             
+        self._reset_index()
+        
+        # List directories concurrently; every finished listing queues its subdirectories
+        listings = {}
+        with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+            pending = {pool.submit(self._scan_dir, self.project_path, suffixes, other_re)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root, files, subdirs = future.result()
+                    listings[root] = (files, subdirs)
+                    for _, path in subdirs:
+                        pending.add(pool.submit(self._scan_dir, path, suffixes, other_re))
+                        
+        # Merge the listings depth-first so the tables follow os.walk order. Each
+        # directory carries its relative prefix ('' at the root, else ending in
+        # os.sep) so paths below it are plain concatenations, not os.path.join
+        stack = [(self.project_path, '', '', -1)]
+        while stack:
+            root, rel_prefix, name, parent = stack.pop()
+            files, subdirs = listings[root]
+            dir_idx = len(self.dir_names)
+            self.dir_names.append(name)
+            self.dir_parents.append(parent)
+            self.dir_children.append([])
+            self.dir_files.append([])
+            if parent >= 0:
+                self.dir_children[parent].append(dir_idx)
+                
             # Add files
-            for file in files:
-                for pattern in file_types:
-                    if glob.fnmatch.fnmatch(file, pattern):
-                        current_level['files'].append(file)
-                        full_path = os.path.join(root, file)
-                        self.files[full_path] = {
-                            'path': full_path,
-                            'rel_path': os.path.join(rel_path, file) if rel_path != '.' else file,
-                            'type': os.path.splitext(file)[1][1:],
-                            'size': os.path.getsize(full_path)
-                        }
-                        break
-        
-        print(f"Project scanned: found {len(self.files)} files")
-        
-    def _read_file(self, file_path: str) -> str:
-        """Read a file's content"""
+            for file, full_path, ext, size in files:
+                type_id = self._type_index.get(ext)
+                if type_id is None:
+                    type_id = self._type_index[ext] = len(self.types_table)
+                    self.types_table.append(ext[1:])
+                self.dir_files[dir_idx].append(len(self.paths))
+                self.path_to_idx[full_path] = len(self.paths)
+                self.paths.append(full_path)
+                self.rel_paths.append(rel_prefix + file)
+                self.type_ids.append(type_id)
+                self.sizes.append(size)
+                
+            children = []
+            for child_name, path in subdirs:
+                children.append((path, rel_prefix + child_name + os.sep, child_name, dir_idx))
+            stack.extend(reversed(children))
+        
+        print(f"Project scanned: found {len(self.paths)} files")
+        
+    def _scan_dir(self, root: str, suffixes: set, other_re: Optional[Pattern]) -> Tuple[str, list, list]:
+        """List one directory, returning its matching files and its subdirectories"""
+        files = []
+        subdirs = []
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            return root, files, subdirs
+            
+        # Reuse the DirEntry type and stat data instead of extra stat calls
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((entry.name, entry.path))
+                continue
+            if not entry.is_file():
+                continue
+                
+            # Same result as os.path.splitext(file)[1] (leading dots do not
+            # start an extension) without building the intermediate tuple.
+            # Suffixes are matched against everything from the last dot, as
+            # fnmatch would: '*.py' also matches a file named '.py'.
+            file = entry.name
+            dot = file.rfind('.')
+            ext = file[dot:] if dot > 0 and (file[0] != '.' or file[:dot].strip('.')) else ''
+            if ((dot >= 0 and os.path.normcase(file[dot:]) in suffixes) or
+                    (other_re is not None and other_re.match(os.path.normcase(file)))):
+                files.append((file, entry.path, ext, entry.stat().st_size))
+                
+        return root, files, subdirs
+        
+    def _get_state(self, file_path: str) -> FileState:
+        """Shared FileState for a file, re-read only when its mtime or size changes"""
+        st = os.stat(file_path)
+        state = self._current_state(file_path, st)
+        if state is None:
+            with open(file_path, 'rb') as f:
+                state = FileState(f.read(), st.st_mtime_ns, st.st_size)
+            self._keep_state(file_path, state)
+        return state
+        
+    def _current_state(self, file_path: str, st: os.stat_result) -> Optional[FileState]:
+        """The kept FileState for a file if it still matches st, marking it recently used"""
+        with self._state_lock:
+            state = self._state.get(file_path)
+            if state is None or state.mtime_ns != st.st_mtime_ns or state.size != st.st_size:
+                return None
+            self._state.move_to_end(file_path)
+            self._touch_derived(file_path, state)
+            return state
+            
+    def _keep_state(self, file_path: str, state: FileState) -> None:
+        """Keep a FileState for later commands, evicting the least recently used past the budgets"""
+        # Pool workers share the tables, so they only change under the lock.
+        # Bytes are kept up to state_budget; only the most recently used
+        # _DERIVED_BUDGET worth also keep their text and line index.
+        with self._state_lock:
+            self._forget(file_path)
+            self._state[file_path] = state
+            self._state_bytes += state.size
+            while self._state_bytes > self._state_budget and len(self._state) > 1:
+                self._forget(next(iter(self._state)))
+            self._touch_derived(file_path, state)
+            
+    def _touch_derived(self, file_path: str, state: FileState) -> None:
+        """Mark a kept state's text and line index as recently used; call with the lock held"""
+        if file_path in self._derived:
+            self._derived.move_to_end(file_path)
+            return
+        self._derived[file_path] = state
+        self._derived_bytes += state.size
+        while self._derived_bytes > _DERIVED_BUDGET and len(self._derived) > 1:
+            _, old = self._derived.popitem(last=False)
+            self._derived_bytes -= old.size
+            old.drop_derived()
+            
+    def _forget(self, file_path: str) -> None:
+        """Remove a file from both state tables; call with the lock held"""
+        old = self._state.pop(file_path, None)
+        if old is not None:
+            self._state_bytes -= old.size
+        old = self._derived.pop(file_path, None)
+        if old is not None:
+            self._derived_bytes -= old.size
+            
+    def _drop_state(self, file_path: str) -> None:
+        """Forget the kept FileState for a file"""
+        with self._state_lock:
+            self._forget(file_path)
+        
+    def _read_state(self, file_path: str) -> Optional[FileState]:
+        """Fetch a file's FileState with its text decoded, or None if it cannot be read"""
+        try:
+            state = self._get_state(file_path)
+            state.text
+            return state
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            return None
+            
+    def _search_state(self, file_path: str) -> FileState:
+        """FileState for searching: the kept one if current, else a private one not yet kept"""
+        # Files failing the literal prefilter never need their text or line
+        # index, so _search_file keeps a new state only once it has a hit
+        try:
+            st = os.stat(file_path)
+            state = self._current_state(file_path, st)
+            if state is not None:
+                return state
+            if st.st_size < _MMAP_THRESHOLD:
+                with open(file_path, 'rb') as f:
+                    return FileState(f.read(), st.st_mtime_ns, st.st_size)
+                    
+            # Mapped states are private to one search and closed after it, so
+            # no file descriptors or mappings outlive the call
+            with open(file_path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)  # Let the kernel read ahead
+            return FileState(mm, st.st_mtime_ns, st.st_size)
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
-            return ""
+            return FileState(b"", 0, 0)
             
     def analyze_python_file(self, file_path: str) -> Dict[str, Any]:
         """Analyze a Python file for classes, functions, imports, etc."""
-        content = self._read_file(file_path)
-        if not content:
+        file_path = os.path.abspath(file_path)
+        analysis, key = self._cached_result(file_path, self._analyze_file,
+                                            self._cache_rows('analysis', file_path))
+        if key is not None:
+            self._cache_store('analysis', {file_path: (key, analysis)})
+        return analysis
+        
+    def _analyze_file(self, file_path: str) -> Dict[str, Any]:
+        """Extract imports, classes, functions and variables from a Python file"""
+        state = self._read_state(file_path)
+        if state is None or not state.text:
             return {}
             
         analysis = {
@@ -74,52 +643,9 @@ class MCP:
         }
         
         try:
-            tree = ast.parse(content)
+            tree = state.tree
             
-            for node in ast.walk(tree):
-                # Check for imports
-                if isinstance(node, ast.Import):
-                    for name in node.names:
-                        analysis['imports'].append(name.name)
-                elif isinstance(node, ast.ImportFrom):
-                    module = node.module if node.module else ''
-                    for name in node.names:
-                        analysis['imports'].append(f"{module}.{name.name}")
-                        
-                # Check for class definitions
-                elif isinstance(node, ast.ClassDef):
-                    class_info = {
-                        'name': node.name,
-                        'methods': [],
-                        'line': node.lineno
-                    }
-                    
-                    for item in node.body:
-                        if isinstance(item, ast.FunctionDef):
-                            class_info['methods'].append({
-                                'name': item.name,
-                                'line': item.lineno,
-                                'args': [arg.arg for arg in item.args.args]
-                            })
-                            
-                    analysis['classes'].append(class_info)
-                    
-                # Check for functions
-                elif isinstance(node, ast.FunctionDef) and not isinstance(node.parent, ast.ClassDef):
-                    analysis['functions'].append({
-                        'name': node.name,
-                        'line': node.lineno,
-                        'args': [arg.arg for arg in node.args.args]
-                    })
-                    
-                # Check global variables
-                elif isinstance(node, ast.Assign) and node.parent == tree:
-                    for target in node.targets:
-                        if isinstance(target, ast.Name):
-                            analysis['variables'].append({
-                                'name': target.id,
-                                'line': node.lineno
-                            })
+            _TopLevelVisitor(analysis).visit(tree)
                             
         except SyntaxError as e:
             analysis['error'] = f"Syntax error at line {e.lineno}: {e.msg}"
@@ -128,87 +654,135 @@ class MCP:
             
         return analysis
     
-    def search_code(self, pattern: str) -> List[Dict[str, Any]]:
-        """Search for a regex pattern across all files"""
+    def search_code(self, pattern: str, use_re2: bool = False) -> List[Dict[str, Any]]:
+        """Search for a regex pattern across all files, optionally with the RE2 engine"""
+        regex = _compile_search(pattern, use_re2)
+        # The literal comes from re's parser, which reads some syntax (POSIX
+        # classes like [[:alpha:]]) differently from RE2, so only re patterns get one
+        literal = _required_literal(pattern).encode('utf-8') if isinstance(regex, Pattern) else b''
+        search_file = functools.partial(self._search_file, regex=regex, literal=literal)
+        
         results = []
-        for file_path, file_info in self.files.items():
-            content = self._read_file(file_path)
-            matches = re.finditer(pattern, content)
-            
-            file_matches = []
-            for match in matches:
-                # Get line number of match
-                line_number = content[:match.start()].count('\n') + 1
-                context_start = max(0, match.start() - 50)
-                context_end = min(len(content), match.end() + 50)
-                
-                file_matches.append({
-                    'match': match.group(0),
-                    'line': line_number,
-                    'context': content[context_start:context_end]
-                })
-                
-            if file_matches:
-                results.append({
-                    'file': file_info['rel_path'],
-                    'matches': file_matches
-                })
-                
+        with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+            all_matches = _prefetch_map(pool, search_file, self.paths)
+            for rel_path, file_matches in zip(self.rel_paths, all_matches):
+                if file_matches:
+                    results.append({
+                        'file': rel_path,
+                        'matches': file_matches
+                    })
+                    
         return results
         
+    def _search_file(self, file_path: str, regex: Any, literal: bytes) -> List[Dict[str, Any]]:
+        """Collect the matches of a compiled pattern in a single file"""
+        # Files lacking a literal every match needs are skipped before decoding
+        state = self._search_state(file_path)
+        data = state.data
+        try:
+            if data.find(literal) == -1:
+                return []
+            content = state.text
+            if not isinstance(data, mmap.mmap):
+                self._keep_state(file_path, state)
+        except UnicodeDecodeError as e:
+            print(f"Error reading {file_path}: {e}")
+            state = FileState(b"", 0, 0)  # Searched as empty, like an unreadable file
+            content = state.text
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+        
+        file_matches = []
+        for match in regex.finditer(content):
+            # Get line number of match
+            line_number = bisect.bisect_right(state.line_starts, match.start())
+            context_start = max(0, match.start() - 50)
+            context_end = min(len(content), match.end() + 50)
+            
+            file_matches.append({
+                'match': match.group(0),
+                'line': line_number,
+                'context': content[context_start:context_end]
+            })
+            
+        return file_matches
+        
     def find_bugs(self, file_path: str = None) -> List[Dict[str, Any]]:
         """Basic bug detection in Python code"""
         bugs = []
         
         if file_path:
-            files_to_check = [file_path] if file_path in self.files else []
+            files_to_check = [file_path] if file_path in self.path_to_idx else []
         else:
-            files_to_check = [f for f in self.files.keys() if f.endswith('.py')]
+            # Names like '.py' have no extension, but the baseline's endswith('.py') took them
+            py_id = self._type_index.get('.py')
+            bare_id = self._type_index.get('')
+            files_to_check = [f for f, t in zip(self.paths, self.type_ids)
+                              if t == py_id or (t == bare_id and f.endswith('.py'))]
             
-        for file in files_to_check:
-            content = self._read_file(file)
-            if not content:
-                continue
+        # Only files whose content changed since the last cached run are checked again
+        check_file = functools.partial(self._cached_result, compute=self._check_file,
+                                       rows=self._cache_rows('bugs'))
+        fresh = {}
+        with ThreadPoolExecutor(max_workers=_IO_WORKERS) as pool:
+            for file, (file_bugs, key) in zip(files_to_check, _prefetch_map(pool, check_file, files_to_check)):
+                bugs.extend(file_bugs)
+                if key is not None:
+                    fresh[file] = (key, file_bugs)
+        self._cache_store('bugs', fresh)
                 
-            # Check for syntax errors
-            try:
-                ast.parse(content)
-            except SyntaxError as e:
-                bugs.append({
-                    'file': self.files[file]['rel_path'],
-                    'line': e.lineno,
-                    'type': 'Syntax Error',
-                    'message': e.msg
-                })
-                continue  # Skip further checks if syntax is invalid
+        return bugs
+        
+    def _check_file(self, file: str) -> List[Dict[str, Any]]:
+        """Run the bug checks against a single Python file"""
+        bugs = []
+        state = self._read_state(file)
+        if state is None or not state.text:
+            return bugs
+            
+        rel_path = self.rel_paths[self.path_to_idx[file]]
+            
+        # Check for syntax errors
+        try:
+            tree = state.tree
+        except SyntaxError as e:
+            bugs.append({
+                'file': rel_path,
+                'line': e.lineno,
+                'type': 'Syntax Error',
+                'message': e.msg
+            })
+            return bugs  # Skip further checks if syntax is invalid
+            
+        # Structural checks on the (cached) tree, lexical ones with one regex pass
+        hits = _find_structural_bugs(tree)
+        
+        pattern_hits = _scan_for_bugs(state.text)
+        if pattern_hits:
+            line_starts = state.line_starts
+            for pattern_id, offset in pattern_hits:
+                bug_type, suggestion = _BUG_META[pattern_id]
+                hits.append((bisect.bisect_right(line_starts, offset), bug_type, suggestion))
                 
-            # Common Python bugs and anti-patterns
-            patterns = [
-                (r'except:', 'Bare except clause', 'Use specific exceptions'),
-                (r'except Exception:', 'Too broad exception handling', 'Use more specific exceptions'),
-                (r'\.get\([^,]+\)', 'dict.get() without default', 'Provide default value to avoid potential None'),
-                (r'print\(.*\)', 'Debug print statement', 'Remove debug prints'),
-                (r'.*=\s*\[\]\s*\nfor.*:.*\.append', 'Inefficient list building', 'Use list comprehension'),
-                (r'if\s+[^=!<>]+\s+==\s+True', 'Unnecessary comparison to True', 'Use "if condition:" instead'),
-                (r'if\s+[^=!<>]+\s+==\s+False', 'Unnecessary comparison to False', 'Use "if not condition:" instead')
-            ]
+        hits.sort(key=lambda hit: hit[0])
+        for line, bug_type, suggestion in hits:
+            bugs.append({
+                'file': rel_path,
+                'line': line,
+                'type': bug_type,
+                'message': suggestion
+            })
             
-            for pattern, bug_type, suggestion in patterns:
-                for match in re.finditer(pattern, content):
-                    line_number = content[:match.start()].count('\n') + 1
-                    bugs.append({
-                        'file': self.files[file]['rel_path'],
-                        'line': line_number,
-                        'type': bug_type,
-                        'message': suggestion
-                    })
-                    
         return bugs
         
     def update_file(self, file_path: str, content: str) -> bool:
         """Update a file with new content"""
         if not os.path.isabs(file_path):
             file_path = os.path.join(self.project_path, file_path)
+        # A rewrite within the filesystem's mtime granularity could keep the
+        # same size and mtime, so don't rely on the stat check to notice it
+        self._drop_state(file_path)
             
         try:
             with open(file_path, 'w', encoding='utf-8') as f:
@@ -221,27 +795,37 @@ class MCP:
             
     def print_structure(self, max_depth: int = None) -> None:
         """Print the project structure"""
-        def _print_dir(structure, prefix="", depth=0):
+        out = [f"Project structure for: {self.project_path}"]
+        
+        # Depth-first over an explicit stack of (directory, prefix, depth, header);
+        # subdirectories are pushed in reverse so they come out in sorted order
+        stack = [(0, "", 0, None)] if self.dir_names else []
+        while stack:
+            dir_idx, prefix, depth, header = stack.pop()
+            if header is not None:
+                out.append(header)
             if max_depth is not None and depth > max_depth:
-                return
+                continue
                 
-            # Print files
-            for file in sorted(structure['files']):
-                print(f"{prefix}├── {file}")
+            # Files
+            for file in sorted(os.path.basename(self.rel_paths[i]) for i in self.dir_files[dir_idx]):
+                out.append(f"{prefix}├── {file}")
                 
-            # Print directories
-            dirs = list(structure['dirs'].keys())
-            for i, dir_name in enumerate(sorted(dirs)):
+            # Directories
+            dirs = sorted(self.dir_children[dir_idx], key=self.dir_names.__getitem__)
+            children = []
+            for i, child in enumerate(dirs):
                 is_last = i == len(dirs) - 1
-                print(f"{prefix}{'└── ' if is_last else '├── '}{dir_name}/")
-                _print_dir(
-                    structure['dirs'][dir_name],
-                    prefix + ("    " if is_last else "│   "),
-                    depth + 1
-                )
-                
-        print(f"Project structure for: {self.project_path}")
-        _print_dir(self.structure)
+                children.append((
+                    child,
+                    f"{prefix}{'    ' if is_last else '│   '}",
+                    depth + 1,
+                    f"{prefix}{'└── ' if is_last else '├── '}{self.dir_names[child]}/"
+                ))
+            stack.extend(reversed(children))
+            
+        # One write for the whole tree instead of a print() per line
+        sys.stdout.write('\n'.join(out) + '\n')
 
 def main():
     parser = argparse.ArgumentParser(description="MCP Code Assistant")
@@ -250,11 +834,13 @@ def main():
     parser.add_argument("--structure", action="store_true", help="Print project structure")
     parser.add_argument("--analyze", help="Analyze a specific Python file")
     parser.add_argument("--search", help="Search for a pattern in code")
+    parser.add_argument("--re2", action="store_true", help="Match --search patterns with RE2 (requires google-re2)")
     parser.add_argument("--bugs", action="store_true", help="Find potential bugs")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the result cache")
     
     args = parser.parse_args()
     
-    mcp = MCP(args.project_path)
+    mcp = MCP(args.project_path, use_cache=not args.no_cache)
     
     if args.scan or args.structure or args.analyze or args.search or args.bugs:
         mcp.scan_project()
@@ -276,7 +862,9 @@ def main():
             print(f"  {func['name']}({', '.join(func['args'])}) at line {func['line']}")
             
     if args.search:
-        results = mcp.search_code(args.search)
+        if args.re2 and re2 is None:
+            print("google-re2 is not installed; searching with re")
+        results = mcp.search_code(args.search, use_re2=args.re2)
         print(f"Search results for pattern '{args.search}':")
         for file_result in results:
             print(f"\nFile: {file_result['file']}")